@@ -0,0 +1,37 @@
+"""Per-request cost of cookie authentication, with and without the verified-token cache.
+
+    python -m benchmarks.auth_overhead [iterations]
+"""
+import asyncio
+import sys
+import time
+from datetime import timedelta
+
+from utils.auth_util import create_access_token, get_current_user, verified_tokens
+
+
+async def measure(token: str, iterations: int, cached: bool) -> float:
+    verified_tokens.clear()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if not cached:
+            verified_tokens.clear()
+        await get_current_user(token)
+    return (time.perf_counter() - start) / iterations * 1_000_000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    token = create_access_token("benchmark", 1, timedelta(minutes=20))
+
+    uncached = asyncio.run(measure(token, iterations, cached=False))
+    cached = asyncio.run(measure(token, iterations, cached=True))
+
+    print(f"iterations:        {iterations}")
+    print(f"full verification: {uncached:8.2f} us/request")
+    print(f"cached:            {cached:8.2f} us/request")
+    print(f"speedup:           {uncached / cached:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
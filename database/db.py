@@ -1,4 +1,8 @@
-from sqlalchemy import create_engine,event
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from sqlalchemy import create_engine,event,text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from config.config import setting
@@ -16,6 +20,10 @@ engine = create_engine(
     echo=False
 )
 
+if setting.QUERY_PROFILER_ENABLED:
+    from utils.query_profiler import query_profiler
+    query_profiler.install(engine)
+
 @event.listens_for(engine, "connect")
 def on_connect(dbapi_connection, connection_record):
     logger.info("Database connection established")
@@ -30,3 +38,68 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def wait_for_database(retries: int = setting.DB_STARTUP_RETRIES, delay: float = setting.DB_STARTUP_RETRY_DELAY_SECONDS):
+    """Block until the database answers, backing off exponentially between attempts."""
+    for attempt in range(1, retries + 1):
+        try:
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            return attempt
+        except OperationalError as e:
+            if attempt == retries:
+                raise
+            logger.warning("Database unavailable (attempt %s/%s): %s", attempt, retries, e)
+            time.sleep(delay * 2 ** (attempt - 1))
+
+
+def warm_pool(size: int = setting.DB_POOL_WARMUP):
+    """Open ``size`` pooled connections up front so early requests skip the handshake."""
+    size = min(size, setting.DB_POOL_SIZE)
+    if size <= 0:
+        return 0
+
+    # Hold every connection at once, otherwise the pool just hands back the same one
+    with ThreadPoolExecutor(max_workers=size) as executor:
+        connections = list(executor.map(lambda _: engine.connect(), range(size)))
+    for connection in connections:
+        connection.close()
+    return size
+
+
+# Advisory lock key: the activity rebuild holds it exclusively, and everything
+# else that moves activity counters or archived comments holds it shared
+ACTIVITY_REBUILD_LOCK = 3_614_001
+
+
+def hold_shared_lock(db, key: int):
+    """Take advisory lock ``key`` in shared mode until ``db``'s transaction ends; a no-op off Postgres.
+
+    Take it before any row lock: the exclusive holder waits on its own
+    connection, where the deadlock detector cannot see it.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock_shared(:key)"), {"key": key})
+
+
+@contextmanager
+def exclusive_lock(key: int, bind=engine):
+    """Hold advisory lock ``key`` exclusively on a connection of its own; a no-op off Postgres.
+
+    Taken outside the caller's session, so every transaction the caller opens
+    meanwhile starts after the lock is granted and sees what the shared
+    holders committed before it.
+    """
+    if bind.dialect.name != "postgresql":
+        yield
+        return
+    with bind.connect() as connection:
+        connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": key})
+        # Session-level lock: it survives the commit, which keeps the connection from idling in a transaction
+        connection.commit()
+        try:
+            yield
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+            connection.commit()
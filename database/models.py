@@ -1,7 +1,9 @@
-
+from datetime import datetime
+from typing import Optional
 from sqlalchemy.ext.declarative import declared_attr
+from config.config import setting
 from database.db import Base
-from sqlalchemy import event, Integer, String, DateTime, Boolean, ForeignKey,func
+from sqlalchemy import event, false, select, Index, UniqueConstraint, Integer, String, DateTime, Boolean, ForeignKey, JSON, func
 from sqlalchemy.orm import Mapped,mapped_column,relationship
 
 class TimestampMixin:
@@ -21,12 +23,14 @@ class User(Base,TimestampMixin):
     email:Mapped[str] = mapped_column(String, nullable=False, unique=True)
     password_hash:Mapped[str] = mapped_column(String, nullable=False)
     active:Mapped[bool] = mapped_column(Boolean)
+    total_posts:Mapped[int] = mapped_column(Integer, default=0, server_default="0")
 
     posts:Mapped[list['Post']] = relationship(
         back_populates="owner",
         cascade="all, delete-orphan",
     )
     comments:Mapped[list['Comment']] = relationship(back_populates="owner",cascade="all, delete-orphan")
+    activity:Mapped[Optional['UserActivity']] = relationship(cascade="all, delete-orphan")
 
 
 class Post(Base, TimestampMixin):
@@ -34,35 +38,115 @@ class Post(Base, TimestampMixin):
     id:Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     title:Mapped[str] = mapped_column(String, nullable=False, unique=True)
     description:Mapped[str] = mapped_column(String, nullable=False)
-    owner_id:Mapped[int] = mapped_column(Integer, ForeignKey("users.id"))
+    owner_id:Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), index=True)
     total_comments:Mapped[int] = mapped_column(Integer,default=0)
+    archived:Mapped[bool] = mapped_column(Boolean, default=False, server_default=false(), nullable=False)
 
     owner:Mapped['User'] = relationship(back_populates="posts")
     comments:Mapped[list['Comment']] = relationship(back_populates='post',cascade="all, delete-orphan")
+    archive:Mapped[Optional['ArchivedThread']] = relationship(cascade="all, delete-orphan")
+    archive_authors:Mapped[list['ArchivedCommentAuthor']] = relationship(cascade="all, delete-orphan")
+    activity:Mapped[Optional['PostActivity']] = relationship(cascade="all, delete-orphan")
 
 class Comment(Base, TimestampMixin):
     __tablename__ = "comments"
     id:Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     comment:Mapped[str] = mapped_column(String, nullable=False)
     owner_id:Mapped[int] = mapped_column(Integer, ForeignKey("users.id"))
-    post_id:Mapped[int] = mapped_column(Integer, ForeignKey("posts.id"))
+    post_id:Mapped[int] = mapped_column(Integer, ForeignKey("posts.id"), index=True)
+
+    if setting.COMMENTS_PARTITIONED:
+        # Postgres range partitions on created_at require it in the primary key
+        created_at:Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False, primary_key=True)
+        __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
     owner:Mapped['User'] = relationship(back_populates="comments")
     post:Mapped['Post'] = relationship(back_populates="comments")
 
-@event.listens_for(Comment, 'after_insert')
-def update_total_comment(mapper, connection, target):
-    connection.execute(
-        Post.__table__.update()
-        .where(Post.__table__.c.id == target.id)
-        .values(total_comments=Post.__table__.c.total_comments + 1)
+class ArchivedThread(Base):
+    """Read-only copy of a cold thread's comments, one compact row per post."""
+    __tablename__ = "archived_threads"
+    post_id:Mapped[int] = mapped_column(Integer, ForeignKey("posts.id"), primary_key=True)
+    comment_count:Mapped[int] = mapped_column(Integer, nullable=False)
+    # [[id, owner_id, comment, created_at, updated_at], ...] ordered by id
+    comments:Mapped[list] = mapped_column(JSON, nullable=False)
+    archived_at:Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+class ArchivedCommentAuthor(Base):
+    """Who wrote how many comments in each archived thread, so the blobs can be found by author."""
+    __tablename__ = "archived_comment_authors"
+    user_id:Mapped[int] = mapped_column(Integer, primary_key=True)
+    post_id:Mapped[int] = mapped_column(Integer, ForeignKey("posts.id"), primary_key=True, index=True)
+    comment_count:Mapped[int] = mapped_column(Integer, nullable=False)
+
+class UserActivity(Base):
+    __tablename__ = "user_activity"
+    user_id:Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), primary_key=True)
+    comments_count:Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Comments left by other users on this user's posts
+    comments_received:Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_activity_at:Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+class PostActivity(Base):
+    __tablename__ = "post_activity"
+    post_id:Mapped[int] = mapped_column(Integer, ForeignKey("posts.id"), primary_key=True)
+    commenters_count:Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_comment_at:Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    id:Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id:Mapped[int] = mapped_column(Integer, nullable=False)
+    key:Mapped[str] = mapped_column(String, nullable=False)
+    fingerprint:Mapped[str] = mapped_column(String, nullable=False)
+    status_code:Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    response_body:Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    expires_at:Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_id_key"),
     )
 
+class RevokedToken(Base):
+    """Logged-out tokens, shared by every worker until the token would have expired anyway."""
+    __tablename__ = "revoked_tokens"
+    # sha256 of the token, hex encoded
+    digest:Mapped[str] = mapped_column(String, primary_key=True)
+    expires_at:Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
+    revoked_at:Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+    version:Mapped[int] = mapped_column(Integer, primary_key=True)
+
+class Counter(Base):
+    __tablename__ = "counters"
+    name:Mapped[str] = mapped_column(String, primary_key=True)
+    value:Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+class OutboxEvent(Base, TimestampMixin):
+    __tablename__ = "outbox_events"
+    id:Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    topic:Mapped[str] = mapped_column(String, nullable=False)
+    payload:Mapped[dict] = mapped_column(JSON, nullable=False)
+    status:Mapped[str] = mapped_column(String, nullable=False, default="pending")
+    attempts:Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    available_at:Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_error:Mapped[Optional[str]] = mapped_column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ix_outbox_events_status_available_at", "status", "available_at"),
+        Index("ix_outbox_events_status_updated_at", "status", "updated_at"),
+    )
 
-@event.listens_for(Comment, 'after_delete')
-def decrement_comment_count(mapper, connection, target):
+@event.listens_for(Base.metadata, "after_create")
+def seed_counters(target, connection, tables=(), **kw):
+    # Seeded once, when the table is first created; the outbox worker keeps it current from then on
+    if Counter.__table__ not in tables:
+        return
     connection.execute(
-        Post.__table__.update()
-        .where(Post.__table__.c.id == target.post_id)
-        .values(total_comments=Post.__table__.c.total_comments - 1)
-    )
\ No newline at end of file
+        Counter.__table__.insert().values(
+            name="posts",
+            value=select(func.count(Post.__table__.c.id)).scalar_subquery(),
+        )
+    )
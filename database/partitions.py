@@ -0,0 +1,92 @@
+"""Monthly range partitions for the comments table (Postgres only).
+
+New months need their partition before rows arrive, otherwise those rows
+land in ``comments_default``. Schedule this on its own, e.g. daily from cron::
+
+    python -m database.partitions
+"""
+import logging
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from config.config import setting
+
+logger = logging.getLogger(__name__)
+
+
+def add_months(day: date, months: int) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def comments_partitioned(connection) -> bool:
+    return connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('comments'))"
+    )).scalar()
+
+
+def create_partition(connection, name: str, start: date, end: date):
+    bounds = f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    try:
+        with connection.begin_nested():
+            connection.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF comments {bounds}"))
+        return
+    except DBAPIError as e:
+        # Usually rows for this month already landed in the default partition
+        logger.warning("Creating %s failed, moving its rows out of comments_default: %s", name, e)
+
+    with connection.begin_nested():
+        connection.execute(text("ALTER TABLE comments DETACH PARTITION comments_default"))
+        connection.execute(text(f"CREATE TABLE {name} PARTITION OF comments {bounds}"))
+        in_range = "created_at >= :start AND created_at < :end"
+        params = {"start": start, "end": end}
+        connection.execute(text(f"INSERT INTO {name} SELECT * FROM comments_default WHERE {in_range}"), params)
+        connection.execute(text(f"DELETE FROM comments_default WHERE {in_range}"), params)
+        connection.execute(text("ALTER TABLE comments ATTACH PARTITION comments_default DEFAULT"))
+
+
+def ensure_comment_partitions(connection, months_ahead: int = setting.COMMENT_PARTITION_MONTHS_AHEAD, today: Optional[date] = None) -> List[str]:
+    """Create the current and next ``months_ahead`` monthly partitions if they are missing."""
+    if not setting.COMMENTS_PARTITIONED or connection.dialect.name != "postgresql":
+        return []
+
+    if not comments_partitioned(connection):
+        # create_all never converts an existing table; it stays a plain table until migrated by hand
+        logger.warning(
+            "comments was created before partitioning and is a plain table; skipping monthly partitions"
+        )
+        return []
+
+    # Rows older than the first monthly partition land here
+    connection.execute(text("CREATE TABLE IF NOT EXISTS comments_default PARTITION OF comments DEFAULT"))
+
+    first = (today or date.today()).replace(day=1)
+    created = []
+    for offset in range(months_ahead + 1):
+        start = add_months(first, offset)
+        end = add_months(start, 1)
+        name = f"comments_p{start:%Y_%m}"
+        try:
+            create_partition(connection, name, start, end)
+        except DBAPIError as e:
+            # One bad month must not stop the others, nor whatever runs after this
+            logger.error("Could not create partition %s: %s", name, e)
+            continue
+        created.append(name)
+    return created
+
+
+def main():
+    from database.db import engine
+
+    with engine.begin() as connection:
+        created = ensure_comment_partitions(connection)
+    logger.info("Comment partitions in place: %s", ", ".join(created) or "none")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,149 @@
+"""Schema creation, upgrade and the DDL-free check the app runs at startup.
+
+Create or upgrade the schema out of band with::
+
+    python -m database.schema
+
+``create_all`` only creates missing tables, so the upgrade also adds missing
+columns and indexes to tables that already exist, then runs the data steps
+of every version the database has not reached yet. A database it cannot
+bring in line with the models (e.g. a missing NOT NULL column without a
+default) is reported and never stamped.
+
+Bump ``SCHEMA_VERSION`` whenever a model change needs that step re-run, and
+register a data step in ``DATA_STEPS`` when existing rows need rewriting.
+"""
+import logging
+from typing import Callable, Dict, List
+
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateColumn
+
+from database.db import Base, engine
+from database import models
+from database.partitions import ensure_comment_partitions
+from utils.archive import index_archived_authors
+from utils.counters import backfill_counters
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 6
+
+
+class SchemaMismatchError(RuntimeError):
+    pass
+
+
+# Version -> step that rewrites existing rows when a database first reaches it
+DATA_STEPS: Dict[int, Callable[[Session], None]] = {
+    # users.total_posts and posts.total_comments were never backfilled, and
+    # total_comments was incremented on the wrong post before the outbox
+    5: backfill_counters,
+    # Threads archived before archived_comment_authors existed
+    6: index_archived_authors,
+}
+
+
+def current_version(connection):
+    if not inspect(connection).has_table(models.SchemaVersion.__tablename__):
+        return None
+    return connection.execute(select(models.SchemaVersion.version)).scalar()
+
+
+def schema_problems(connection) -> List[str]:
+    """Every table, column and index the models map that the database lacks."""
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    problems = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            problems.append(f"missing table {table.name}")
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        problems.extend(
+            f"missing column {table.name}.{column.name}"
+            for column in table.columns if column.name not in columns
+        )
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        problems.extend(
+            f"missing index {index.name}"
+            for index in table.indexes if index.name not in indexes
+        )
+    return problems
+
+
+def add_missing_columns_and_indexes(connection) -> List[str]:
+    """Add what ``create_all`` skips on existing tables, where that is safe to do in place."""
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    preparer = connection.dialect.identifier_preparer
+    applied = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            # Existing rows need a value: only nullable or server-defaulted columns can be added
+            if column.primary_key or not (column.nullable or column.server_default is not None):
+                continue
+            connection.exec_driver_sql(
+                f"ALTER TABLE {preparer.format_table(table)} "
+                f"ADD COLUMN {CreateColumn(column).compile(dialect=connection.dialect)}"
+            )
+            applied.append(f"added column {table.name}.{column.name}")
+
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(connection)
+                applied.append(f"added index {index.name}")
+    return applied
+
+
+def check_schema():
+    with engine.connect() as connection:
+        version = current_version(connection)
+        if version != SCHEMA_VERSION:
+            raise SchemaMismatchError(
+                f"Database schema version is {version}, expected {SCHEMA_VERSION}; "
+                "run `python -m database.schema`"
+            )
+
+        problems = schema_problems(connection)
+        if problems:
+            raise SchemaMismatchError(f"Database does not match the models: {'; '.join(problems)}")
+    return version
+
+
+def create_schema():
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        previous = current_version(connection)
+        for change in add_missing_columns_and_indexes(connection):
+            logger.info("Schema upgrade: %s", change)
+        ensure_comment_partitions(connection)
+
+        problems = schema_problems(connection)
+        if problems:
+            raise SchemaMismatchError(
+                f"Cannot upgrade the database in place, not stamping version {SCHEMA_VERSION}: {'; '.join(problems)}"
+            )
+
+    with Session(engine) as db:
+        for version in sorted(DATA_STEPS):
+            if (previous or 0) < version <= SCHEMA_VERSION:
+                logger.info("Running data step for schema version %s", version)
+                DATA_STEPS[version](db)
+
+        db.query(models.SchemaVersion).delete()
+        db.add(models.SchemaVersion(version=SCHEMA_VERSION))
+        db.commit()
+    return SCHEMA_VERSION
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Schema at version %s", create_schema())
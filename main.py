@@ -1,18 +1,82 @@
+import asyncio
+import importlib
+import logging
+import time
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
-from database.db import engine
+from config.config import setting
+from database.db import engine, wait_for_database, warm_pool
+from database.schema import check_schema, create_schema
 from middleware.AdvancedMiddleware import AdvancedMiddleware
-from routers import users, posts, comment, health
-from database import models
-app = FastAPI()
+from middleware.MetricsMiddleware import MetricsMiddleware
+from middleware.QueryProfilerMiddleware import QueryProfilerMiddleware
+from routers import users, posts, comment, health, admin
+from utils.auth_util import revocation_sync
+from utils.health_checker import health_checker
+from utils.idempotency import expired_key_cleaner
+from utils.outbox import outbox_worker
+
+logger = logging.getLogger(__name__)
+
+
+def preload_modules():
+    loaded = 0
+    for module in setting.STARTUP_PRELOAD_MODULES:
+        try:
+            importlib.import_module(module)
+            loaded += 1
+        except ImportError:
+            logger.warning("Could not preload %s", module)
+    return loaded
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    timings = {}
+
+    async def step(name, fn):
+        start = time.perf_counter()
+        result = await asyncio.to_thread(fn)
+        timings[name] = round((time.perf_counter() - start) * 1000, 2)
+        return result
+
+    await step("database", wait_for_database)
+    await step("schema", create_schema if setting.DB_CREATE_SCHEMA else check_schema)
+    await step("pool_warmup", warm_pool)
+    await step("preload", preload_modules)
+    timings["total"] = round(sum(timings.values()), 2)
+    app.state.startup_timings = timings
+    logger.info("Startup completed in %sms: %s", timings["total"], timings)
+
+    await health_checker.refresh()
+    health_checker.start()
+    # Tokens logged out before this worker started must be rejected from its first request
+    await asyncio.to_thread(revocation_sync.run_once)
+    revocation_sync.start()
+    expired_key_cleaner.start()
+    if setting.OUTBOX_WORKER_ENABLED:
+        outbox_worker.start()
+    yield
+    await outbox_worker.stop()
+    await health_checker.stop()
+    await expired_key_cleaner.stop()
+    await revocation_sync.stop()
+    # In-flight requests have drained by the time shutdown runs
+    engine.dispose()
 
-models.Base.metadata.create_all(bind=engine)
+app = FastAPI(lifespan=lifespan)
 
+if setting.QUERY_PROFILER_ENABLED:
+    app.add_middleware(QueryProfilerMiddleware)
 app.add_middleware(AdvancedMiddleware)
+app.add_middleware(MetricsMiddleware)
 app.include_router(users.router)
 app.include_router(posts.router)
 app.include_router(comment.router)
 app.include_router(health.router)
+app.include_router(admin.router)
 
 
 @app.get("/")
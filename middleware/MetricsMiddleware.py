@@ -0,0 +1,32 @@
+import time
+
+from utils.metrics import worker_metrics
+
+class MetricsMiddleware:
+    """Plain ASGI: counting a request must not cost it an extra task and stream."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_class = "5xx"
+
+        async def send_with_status(message):
+            nonlocal status_class
+            if message["type"] == "http.response.start":
+                status_class = f"{message['status'] // 100}xx"
+            await send(message)
+
+        worker_metrics.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            worker_metrics.in_flight -= 1
+            worker_metrics.requests += 1
+            worker_metrics.responses[status_class] += 1
+            worker_metrics.request_seconds += time.perf_counter() - start
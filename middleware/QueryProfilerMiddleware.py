@@ -0,0 +1,16 @@
+from collections import Counter
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from utils.query_profiler import current_scope, current_statements, query_profiler
+
+class QueryProfilerMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self,request,call_next):
+        statements = Counter()
+        scope_token = current_scope.set(request.scope)
+        statements_token = current_statements.set(statements)
+        try:
+            return await call_next(request)
+        finally:
+            current_statements.reset(statements_token)
+            current_scope.reset(scope_token)
+            query_profiler.finish_request(request.scope, statements)
@@ -0,0 +1,21 @@
+from fastapi import APIRouter
+from starlette import status
+
+from dependency import admin_dependency
+from utils.query_profiler import query_profiler
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[admin_dependency],
+)
+
+@router.get("/query-report",status_code=status.HTTP_200_OK)
+async def get_query_report():
+    """Slow statements and N+1 patterns recorded by the query profiler"""
+    return query_profiler.report()
+
+@router.delete("/query-report",status_code=status.HTTP_200_OK)
+async def reset_query_report():
+    query_profiler.reset()
+    return {"status": "success", "message": "Query report cleared"}
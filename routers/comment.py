@@ -1,20 +1,86 @@
+import asyncio
 from sqlalchemy import or_
-from fastapi import APIRouter, Path, HTTPException, Query
+from fastapi import APIRouter, Header, Path, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import joinedload
 from starlette import status
 from typing import List, Optional
 import schemas
+from config.config import setting
+from database.db import sessionLocal
 from database.models import Post, Comment, User
-from schemas import CommentRequest, CommentResponse, CommentWithUserDetails, CommentUpdateRequest
+from schemas import CommentRequest, CommentResponse, CommentWithUserDetails, CommentUpdateRequest, CommentEvent
 from dependency import user_dependency,db_dependency
+from utils import idempotency
+from utils.archive import archived_comment_page
+from utils.auth_util import get_current_user
+from utils.comment_stream import comment_hub
+from utils.outbox import enqueue
+from utils.pagination import paginate
 
 router = APIRouter(
     prefix="/comment",
     tags=["comment"]
 )
 
+async def publish_comment_event(event:str, post_id:int, comment_model:Comment, user_model:User):
+    message = CommentEvent(
+        event=event,
+        post_id=post_id,
+        id=comment_model.id,
+        comment=None if event == "deleted" else comment_model.comment,
+        owner=schemas.User(
+            id=user_model.id,
+            username=user_model.username,
+            email=user_model.email,
+        ),
+    )
+    await comment_hub.publish(post_id, message.model_dump_json())
+
+def post_exists(post_id:int) -> bool:
+    # A short-lived session, closed before subscribing: a stream holding its own
+    # pooled connection for its whole lifetime would exhaust the pool
+    db = sessionLocal()
+    try:
+        return db.query(Post.id).filter(Post.id == post_id).first() is not None
+    finally:
+        db.close()
+
+def locked_open_post(db, post_id:int, *options) -> Post:
+    """The post, share-locked for the rest of the transaction; 409 once it is archived.
+
+    The archive job holds FOR UPDATE while it copies a thread and deletes its
+    comments, so no comment can be created, edited or deleted in between and
+    then be lost or resurrected by the archived copy.
+    """
+    post_model = (db
+                  .query(Post)
+                  .filter(Post.id == post_id)
+                  .options(*options)
+                  .with_for_update(read=True, of=Post)
+                  .first())
+
+    if post_model is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Post not found"
+        )
+
+    if post_model.archived:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Post is archived"
+        )
+    return post_model
+
 @router.post("/{post_id}",response_model=CommentResponse, status_code=status.HTTP_200_OK)
-async def create_comment(user:user_dependency,db:db_dependency,comment_request:CommentRequest,post_id:int = Path(gt=0)):
+async def create_comment(
+        user:user_dependency,
+        db:db_dependency,
+        comment_request:CommentRequest,
+        post_id:int = Path(gt=0),
+        idempotency_key:Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    ):
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -28,17 +94,17 @@ async def create_comment(user:user_dependency,db:db_dependency,comment_request:C
             detail="User not found"
         )
 
-    post_model = (db
-                  .query(Post)
-                  .filter(Post.id == post_id)
-                  .options(joinedload(Post.owner))
-                  .first())
+    # Before any check on the post: a retry after the thread was archived still gets its original response
+    fingerprint = idempotency.request_fingerprint(f"POST /comment/{post_id}", comment_request)
+    replayed = idempotency.replay(db, user_model.id, idempotency_key, fingerprint)
+    if replayed is not None:
+        return replayed
 
-    if post_model is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Post not found"
-        )
+    post_model = locked_open_post(db, post_id, joinedload(Post.owner))
+
+    idempotency_record, replayed = idempotency.reserve(db, user_model.id, idempotency_key, fingerprint)
+    if replayed is not None:
+        return replayed
 
     comment_model = Comment(
         comment=comment_request.comment,
@@ -47,10 +113,11 @@ async def create_comment(user:user_dependency,db:db_dependency,comment_request:C
     )
 
     db.add(comment_model)
-    db.commit()
+    db.flush()
+    enqueue(db, "comment.created", {"comment_id": comment_model.id, "post_id": post_model.id, "owner_id": user_model.id})
     db.refresh(comment_model)
 
-    return CommentResponse(
+    response = CommentResponse(
         id=comment_model.id,
         comment=comment_model.comment,
         created_at=comment_model.created_at,
@@ -73,15 +140,23 @@ async def create_comment(user:user_dependency,db:db_dependency,comment_request:C
             )
         )
     )
+    idempotency.complete(idempotency_record, status.HTTP_200_OK, response)
+    db.commit()
+
+    await publish_comment_event("created", post_model.id, comment_model, user_model)
+
+    return response
 
 @router.get("/{post_id}",response_model=List[CommentWithUserDetails],status_code=status.HTTP_200_OK)
 async def get_all_comments_by_post(
         user:user_dependency,
         db:db_dependency,
+        response:Response,
         post_id:int = Path(gt=0),
         page_number:int = Query(0,gt=-1),
         page_size:int = Query(10,gt=0,le=100),
-        search:Optional[str] = Query(None)
+        search:Optional[str] = Query(None),
+        exact_count:bool = Query(False),
     ):
 
     if user is None:
@@ -104,28 +179,33 @@ async def get_all_comments_by_post(
             detail="Post not found"
         )
 
+    if post_model.archived:
+        return archived_comment_page(
+            db, post_model, response, page_number, page_size, search,
+            detail="You have reached the maximum number of pages",
+        )
+
     query = (db
                 .query(Comment)
                 .filter(Comment.post_id == post_model.id)
                 .options(joinedload(Comment.owner))
                 )
 
+    if setting.COMMENTS_PARTITIONED:
+        # A thread's comments are never older than its post, so partitions before it are pruned
+        query = query.filter(Comment.created_at >= post_model.created_at)
+
     if search:
         search_item = f"%{search}%"
         query = query.filter(
             or_(Comment.comment.ilike(search_item))
         )
 
-    total_count = query.count()
-    if page_size * page_number > total_count:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="You have reached the maximum number of pages"
-        )
-
-    comments = query.offset(page_number).limit(page_size).all()
-
-    return comments
+    total_count = None if search else post_model.total_comments
+    return paginate(
+        query, response, page_number, page_size, total_count, exact_count,
+        detail="You have reached the maximum number of pages",
+    )
 
 @router.put("/{comment_id}",response_model=CommentWithUserDetails,status_code=status.HTTP_200_OK)
 async def update_comment_details(user:user_dependency,db:db_dependency,comment_request:CommentUpdateRequest,comment_id:int = Path(gt=0)):
@@ -162,13 +242,18 @@ async def update_comment_details(user:user_dependency,db:db_dependency,comment_r
             detail="Atleast one Field is required"
         )
 
+    locked_open_post(db, comment_model.post_id)
+
     for key,value in updated_comment.items():
         setattr(comment_model, key, value)
 
     db.add(comment_model)
+    enqueue(db, "comment.updated", {"comment_id": comment_model.id, "post_id": comment_model.post_id, "owner_id": user_model.id})
     db.commit()
     db.refresh(comment_model)
 
+    await publish_comment_event("updated", comment_model.post_id, comment_model, user_model)
+
     return CommentWithUserDetails(
         id=comment_model.id,
         comment=comment_model.comment,
@@ -208,9 +293,14 @@ async def delete_comment(user:user_dependency,db:db_dependency,comment_id:int =
             detail="You do not have permission to edit this comment"
         )
 
+    post_id = comment_model.post_id
+    locked_open_post(db, post_id)
     db.delete(comment_model)
+    enqueue(db, "comment.deleted", {"comment_id": comment_model.id, "post_id": post_id, "owner_id": user_model.id})
     db.commit()
 
+    await publish_comment_event("deleted", post_id, comment_model, user_model)
+
     return CommentWithUserDetails(
         id=comment_model.id,
         comment=comment_model.comment,
@@ -221,3 +311,81 @@ async def delete_comment(user:user_dependency,db:db_dependency,comment_id:int =
         ),
         message="Deleted comment"
     )
+
+@router.get("/{post_id}/stream",status_code=status.HTTP_200_OK)
+async def stream_comments(user:user_dependency,post_id:int = Path(gt=0)):
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
+        )
+
+    if not post_exists(post_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Post not found"
+        )
+
+    subscription = comment_hub.subscribe(post_id)
+
+    async def event_source():
+        try:
+            while True:
+                try:
+                    message = await subscription.get(setting.COMMENT_STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    yield "event: disconnect\ndata: slow consumer\n\n"
+                    return
+                yield f"event: comment\ndata: {message}\n\n"
+        finally:
+            comment_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.websocket("/{post_id}/ws")
+async def comments_websocket(websocket:WebSocket,post_id:int = Path(gt=0)):
+    token = websocket.cookies.get("token")
+    try:
+        if token is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+        await get_current_user(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    if not post_exists(post_id):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    async def wait_for_disconnect():
+        # Clients never send anything we act on; reading is how a dead socket gets noticed
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    await websocket.accept()
+    subscription = comment_hub.subscribe(post_id)
+    disconnected = asyncio.create_task(wait_for_disconnect())
+    try:
+        while True:
+            next_message = asyncio.create_task(subscription.get())
+            await asyncio.wait({disconnected, next_message}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                next_message.cancel()
+                return
+            message = next_message.result()
+            if message is None:
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="slow consumer")
+                return
+            await websocket.send_text(message)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        disconnected.cancel()
+        comment_hub.unsubscribe(subscription)
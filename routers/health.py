@@ -1,29 +1,43 @@
-from fastapi import APIRouter
-from sqlalchemy import text
-from dependency import db_dependency
+from fastapi import APIRouter, Request, Response
+from starlette import status
+from utils.health_checker import health_checker
+from utils.metrics import worker_metrics
 
 router = APIRouter(tags=["health"])
 
 @router.get("/health")
-async def health_check(db: db_dependency):
-    """Health check endpoint"""
-    try:
-        # Check database
-        db.execute(text("SELECT 1"))
-        return {
-            "status": "healthy",
-            "database": "connected",
-            "version": "0.1.1"
-        }
-    except Exception as e:
-        return {
-            "status": "unhealthy",
-            "database": "disconnected",
-            "error": str(e)
-        }
+async def health_check():
+    """Health check endpoint, answered from the background checker's last result"""
+    state = health_checker.snapshot()
+    return {
+        "status": "healthy" if state["ready"] else "unhealthy",
+        "database": state["database"]["status"],
+        "version": "0.1.1",
+        "details": state,
+    }
+
+@router.get("/health/live")
+async def liveness():
+    """Liveness probe: the event loop is serving requests"""
+    return {"status": "alive"}
+
+@router.get("/health/ready")
+async def readiness(response: Response):
+    """Readiness probe: the last background check passed and is not stale"""
+    state = health_checker.snapshot()
+    if not state["ready"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {
+        "status": "ready" if state["ready"] else "not ready",
+        "database": state["database"]["status"],
+        "stale": state["stale"],
+        "age_seconds": state["age_seconds"],
+    }
 
 @router.get("/metrics")
-async def metrics():
-    """Basic metrics endpoint"""
-    # Integrate with Prometheus client if needed
-    return {"uptime": "TODO", "requests": "TODO"}
\ No newline at end of file
+async def metrics(request: Request):
+    """Metrics for the worker process that served this request"""
+    return {
+        "worker": worker_metrics.snapshot(),
+        "startup_ms": getattr(request.app.state, "startup_timings", None),
+    }
\ No newline at end of file
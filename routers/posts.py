@@ -1,13 +1,18 @@
+from collections import Counter
 from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException, Path, Query
+from fastapi import APIRouter, Header, HTTPException, Path, Query, Response
 from sqlalchemy.orm import joinedload
 from starlette import status
 from sqlalchemy import or_
 import schemas
-from schemas import PostRequest, PostResponse, PostUpdateRequest, PostResponseWithComments
+from schemas import PostRequest, PostResponse, PostStatsResponse, PostUpdateRequest, PostResponseWithComments
 from dependency import user_dependency,db_dependency
-from database.models import User, Post
+from database.models import User, Post, PostActivity
+from utils import idempotency
+from utils.counters import total_posts
+from utils.outbox import enqueue
+from utils.pagination import paginate
 
 router = APIRouter(
     prefix="/posts",
@@ -15,7 +20,12 @@ router = APIRouter(
 )
 
 @router.post("/",response_model=PostResponse,status_code=status.HTTP_201_CREATED)
-async def create_new_post(user:user_dependency,db:db_dependency,post_request:PostRequest):
+async def create_new_post(
+        user:user_dependency,
+        db:db_dependency,
+        post_request:PostRequest,
+        idempotency_key:Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    ):
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -29,6 +39,14 @@ async def create_new_post(user:user_dependency,db:db_dependency,post_request:Pos
             detail="User not found"
         )
 
+    fingerprint = idempotency.request_fingerprint("POST /posts/", post_request)
+    replayed = idempotency.replay(db, user_model.id, idempotency_key, fingerprint)
+    if replayed is not None:
+        return replayed
+    idempotency_record, replayed = idempotency.reserve(db, user_model.id, idempotency_key, fingerprint)
+    if replayed is not None:
+        return replayed
+
     post_model = Post(
         title=post_request.title,
         description=post_request.description,
@@ -36,10 +54,11 @@ async def create_new_post(user:user_dependency,db:db_dependency,post_request:Pos
         owner=user_model
     )
     db.add(post_model)
-    db.commit()
+    db.flush()
+    enqueue(db, "post.created", {"post_id": post_model.id, "owner_id": user_model.id})
     db.refresh(post_model)
 
-    return PostResponse(
+    response = PostResponse(
         id=post_model.id,
         title=post_model.title,
         description=post_model.description,
@@ -52,14 +71,20 @@ async def create_new_post(user:user_dependency,db:db_dependency,post_request:Pos
         created_at=post_model.created_at,
         updated_at=post_model.updated_at,
     )
+    idempotency.complete(idempotency_record, status.HTTP_201_CREATED, response)
+    db.commit()
+
+    return response
 
 @router.get("/user/all",response_model=List[PostResponseWithComments],status_code=status.HTTP_200_OK)
 async def get_user_all_posts(
         user:user_dependency,
         db:db_dependency,
+        response:Response,
         page_number:int = Query(0,gt=-1),
         page_size:int=Query(10,gt=0,le=100),
         search:Optional[str] = Query(None),
+        exact_count:bool = Query(False),
     ):
     if user is None:
         raise HTTPException(
@@ -86,22 +111,17 @@ async def get_user_all_posts(
             or_(Post.title.ilike(search_item),Post.description.ilike(search_item))
         )
 
-    total_count = query.count()
-    if page_number*page_size > total_count:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="You have reached the limit"
-        )
-
-    post_models = query.offset(page_number*page_size).limit(page_size).all()
-    return post_models
+    total_count = None if search else user_model.total_posts
+    return paginate(query, response, page_number, page_size, total_count, exact_count)
 
 @router.get("/all",response_model=List[PostResponseWithComments],status_code=status.HTTP_200_OK)
 async def get_all_post(
         db:db_dependency,
+        response:Response,
         page_number:int = Query(0,gt=-1),
         page_size:int=Query(10,gt=0,le=100),
         search:Optional[str] = Query(None),
+        exact_count:bool = Query(False),
     ):
     query = db.query(Post).options(joinedload(Post.owner))
 
@@ -111,15 +131,29 @@ async def get_all_post(
             or_(Post.title.ilike(search_item),Post.description.ilike(search_item))
         )
 
-    total_count = query.count()
-    if page_number*page_size > total_count:
+    total_count = None if search else total_posts(db)
+    return paginate(query, response, page_number, page_size, total_count, exact_count)
+
+@router.get("/{post_id}/stats",response_model=PostStatsResponse,status_code=status.HTTP_200_OK)
+async def get_post_stats(db:db_dependency,post_id:int = Path(gt=0)):
+    row = (db
+           .query(Post.id, Post.total_comments, PostActivity)
+           .outerjoin(PostActivity, PostActivity.post_id == Post.id)
+           .filter(Post.id == post_id)
+           .first())
+    if row is None:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="You have reached the limit"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Post not found"
         )
 
-    post_model = query.offset(page_number*page_size).limit(page_size).all()
-    return post_model
+    activity = row.PostActivity
+    return PostStatsResponse(
+        post_id=row.id,
+        comments_count=row.total_comments or 0,
+        commenters_count=activity.commenters_count if activity else 0,
+        last_comment_at=activity.last_comment_at if activity else None,
+    )
 
 @router.put("/{post_id}",response_model=PostResponse,status_code=status.HTTP_200_OK)
 async def update_user_post(user:user_dependency,db:db_dependency,post_request:PostUpdateRequest,post_id:int = Path(gt=0)):
@@ -160,6 +194,7 @@ async def update_user_post(user:user_dependency,db:db_dependency,post_request:Po
         setattr(post_model, key, value)
 
     db.add(post_model)
+    enqueue(db, "post.updated", {"post_id": post_model.id, "owner_id": user_model.id})
     db.commit()
     db.refresh(post_model)
 
@@ -205,7 +240,18 @@ async def delete_user_post(user:user_dependency,db:db_dependency,post_id:int = P
             detail="You are not the owner of this post"
         )
 
+    # The post's comments go with it; their authors' activity counts need to drop
+    commenters = Counter(comment.owner_id for comment in post_model.comments)
+    if post_model.archive is not None:
+        commenters.update(row[1] for row in post_model.archive.comments)
+
     db.delete(post_model)
+    enqueue(db, "post.deleted", {
+        "post_id": post_model.id,
+        "owner_id": user_model.id,
+        "commenters": commenters,
+        "received": sum(count for commenter_id, count in commenters.items() if commenter_id != user_model.id),
+    })
     db.commit()
 
     return PostResponse(
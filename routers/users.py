@@ -1,11 +1,15 @@
 from datetime import timedelta
-from fastapi import APIRouter, HTTPException,Response
+from typing import Annotated, Optional
+from fastapi import APIRouter, Cookie, HTTPException, Path, Response
+from sqlalchemy import func
 
-from database.models import User
+from database.models import User, Comment, Post, UserActivity
 from dependency import db_dependency, form_data_dependency, user_dependency
-from schemas import Token, UserRequest, UserResponse, UserUpdateRequest
+from schemas import Token, UserRequest, UserResponse, UserStatsResponse, UserUpdateRequest
 from starlette import status
-from utils.auth_util import authenticate_user, create_access_token, password_hash
+from utils.auth_util import authenticate_user, create_access_token, password_hash, revoke_token
+from utils.archive import archived_commenters, remove_user_comments
+from utils.outbox import enqueue
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -55,6 +59,15 @@ async def authenticate_user_and_gen_token(
         return {"access_token": token, "token_type": "bearer"}
 
 
+@router.post("/logout", status_code=status.HTTP_200_OK)
+async def logout_user(db:db_dependency,response:Response,token:Annotated[Optional[str], Cookie()] = None):
+    # Rejected by this worker at once and by the others within TOKEN_REVOCATION_SYNC_INTERVAL_SECONDS
+    if token is not None:
+        revoke_token(db, token)
+    response.delete_cookie(key="token", httponly=True)
+    return {"status": "success", "message": "Logged out"}
+
+
 @router.get("/",response_model=UserResponse,status_code=status.HTTP_200_OK)
 async def get_user_detail(user:user_dependency,db:db_dependency):
     if user is None:
@@ -79,6 +92,35 @@ async def get_user_detail(user:user_dependency,db:db_dependency):
         updatedAt=user_model.updated_at,
     )
 
+@router.get("/{user_id}/stats",response_model=UserStatsResponse,status_code=status.HTTP_200_OK)
+async def get_user_stats(user:user_dependency,db:db_dependency,user_id:int = Path(gt=0)):
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Unauthorized",
+        )
+
+    row = (db
+           .query(User.id, User.username, User.total_posts, UserActivity)
+           .outerjoin(UserActivity, UserActivity.user_id == User.id)
+           .filter(User.id == user_id)
+           .first())
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    activity = row.UserActivity
+    return UserStatsResponse(
+        user_id=row.id,
+        username=row.username,
+        posts_count=row.total_posts or 0,
+        comments_count=activity.comments_count if activity else 0,
+        comments_received=activity.comments_received if activity else 0,
+        last_activity_at=activity.last_activity_at if activity else None,
+    )
+
 @router.put("/",response_model=UserResponse,status_code=status.HTTP_200_OK)
 async def update_user_detail(user:user_dependency,db:db_dependency,user_request: UserUpdateRequest):
     if user is None:
@@ -130,6 +172,36 @@ async def delete_user(user:user_dependency,db:db_dependency):
             detail="User not found"
         )
 
+    # Comments on other users' posts go with the account; recount those posts
+    commented_posts = (db
+                       .query(Comment.post_id, func.count(Comment.id))
+                       .join(Post, Post.id == Comment.post_id)
+                       .filter(Comment.owner_id == user_model.id, Post.owner_id != user_model.id)
+                       .group_by(Comment.post_id)
+                       .all())
+    for post_id, count in commented_posts:
+        enqueue(db, "comment.deleted", {"post_id": post_id, "owner_id": user_model.id, "count": count})
+    # Archived copies of those comments go as well, so the archived totals stay exact
+    for post_id, count in remove_user_comments(db, user_model.id).items():
+        enqueue(db, "comment.deleted", {"post_id": post_id, "owner_id": user_model.id, "count": count})
+
+    # Other users' comments on this account's posts go too
+    commenters = (db
+                  .query(Comment.owner_id, func.count(Comment.id))
+                  .join(Post, Post.id == Comment.post_id)
+                  .filter(Post.owner_id == user_model.id, Comment.owner_id != user_model.id)
+                  .group_by(Comment.owner_id)
+                  .all())
+    removed_commenters = archived_commenters(db, user_model.id)
+    removed_commenters.update(dict(commenters))
+
+    owned_posts = db.query(Post).filter(Post.owner_id == user_model.id).count()
+    enqueue(db, "user.deleted", {
+        "user_id": user_model.id,
+        "posts": owned_posts,
+        "commenters": dict(removed_commenters),
+    })
+
     db.delete(user_model)
     db.commit()
 
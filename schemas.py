@@ -23,6 +23,15 @@ class UserResponse(BaseModel):
     createdAt: datetime
     updatedAt: datetime
 
+class UserStatsResponse(BaseModel):
+    user_id: int
+    username: str
+    posts_count: int
+    comments_count: int
+    comments_received: int
+    last_activity_at: Optional[datetime] = None
+    status: str = "success"
+
 class UserUpdateRequest(BaseModel):
     username: Optional[str] = None
     email: Optional[str] = None
@@ -49,6 +58,13 @@ class PostResponse(BaseModel):
 class PostResponseWithComments(PostResponse):
     total_comments: int
 
+class PostStatsResponse(BaseModel):
+    post_id: int
+    comments_count: int
+    commenters_count: int
+    last_comment_at: Optional[datetime] = None
+    status: str = "success"
+
 class PostUpdateRequest(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
@@ -73,5 +89,12 @@ class CommentWithUserDetails(BaseModel):
     message:str = "Successfully done"
     status: str = "success"
 
+class CommentEvent(BaseModel):
+    event: str
+    post_id: int
+    id: int
+    comment: Optional[str] = None
+    owner: Optional[User] = None
+
 class CommentUpdateRequest(BaseModel):
     comment: Optional[str] = Field(None, min_length=5)
\ No newline at end of file
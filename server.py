@@ -0,0 +1,117 @@
+"""Production entry point.
+
+    python server.py
+
+Runs SERVER_WORKERS processes (CPU count by default) under gunicorn with
+uvicorn workers, preloading the app once in the master. When gunicorn is
+not installed it falls back to uvicorn's own process manager.
+DB_POOL_BUDGET / DB_OVERFLOW_BUDGET (20 / 10 by default, the old
+single-process pool) are the connection limits for the whole server and
+are split evenly across workers; set them to 0 to size each worker's pool
+from DB_POOL_SIZE / DB_MAX_OVERFLOW instead.
+"""
+import importlib.util
+import logging
+import os
+
+from config.config import setting
+
+logger = logging.getLogger(__name__)
+
+
+def worker_count() -> int:
+    return setting.SERVER_WORKERS or os.cpu_count() or 1
+
+
+def divide_pool_budget(workers: int):
+    # Must run before database.db is imported, which sizes the engine from these settings
+    if setting.DB_POOL_BUDGET > 0:
+        if workers > setting.DB_POOL_BUDGET:
+            logger.warning(
+                "%s workers exceed DB_POOL_BUDGET=%s; each still needs one connection",
+                workers, setting.DB_POOL_BUDGET,
+            )
+        setting.DB_POOL_SIZE = max(1, setting.DB_POOL_BUDGET // workers)
+    if setting.DB_OVERFLOW_BUDGET > 0:
+        setting.DB_MAX_OVERFLOW = setting.DB_OVERFLOW_BUDGET // workers
+    # Spawned (non-forked) workers rebuild settings from the environment
+    os.environ["DB_POOL_SIZE"] = str(setting.DB_POOL_SIZE)
+    os.environ["DB_MAX_OVERFLOW"] = str(setting.DB_MAX_OVERFLOW)
+    logger.info(
+        "Starting %s workers with pool_size=%s max_overflow=%s each",
+        workers, setting.DB_POOL_SIZE, setting.DB_MAX_OVERFLOW,
+    )
+
+
+def post_fork(server, worker):
+    from database.db import engine
+    from utils.metrics import worker_metrics
+
+    worker_metrics.reset_for_fork()
+    # Never share sockets opened in the master with the children
+    engine.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    from database.db import engine
+
+    engine.dispose()
+
+
+def run_gunicorn(workers: int):
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from main import app
+            return app
+
+    Application({
+        "bind": f"{setting.SERVER_HOST}:{setting.SERVER_PORT}",
+        "workers": workers,
+        # Picks uvloop and httptools automatically when they are installed
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "graceful_timeout": setting.SERVER_GRACEFUL_TIMEOUT_SECONDS,
+        "keepalive": setting.SERVER_KEEPALIVE_SECONDS,
+        "post_fork": post_fork,
+        "worker_exit": worker_exit,
+    }).run()
+
+
+def run_uvicorn(workers: int):
+    import uvicorn
+
+    uvicorn.run(
+        "main:app",
+        host=setting.SERVER_HOST,
+        port=setting.SERVER_PORT,
+        workers=workers,
+        loop="uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        http="httptools" if importlib.util.find_spec("httptools") else "h11",
+        timeout_keep_alive=setting.SERVER_KEEPALIVE_SECONDS,
+        timeout_graceful_shutdown=setting.SERVER_GRACEFUL_TIMEOUT_SECONDS,
+    )
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    workers = worker_count()
+    divide_pool_budget(workers)
+
+    if importlib.util.find_spec("gunicorn"):
+        run_gunicorn(workers)
+    else:
+        run_uvicorn(workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Per-user and per-post activity aggregates.
+
+Outbox handlers keep them current as posts and comments change. To rebuild
+them from scratch for existing data::
+
+    python -m utils.activity [chunk_size]
+
+The rebuild overwrites counters the handlers adjust by deltas, so it holds
+``ACTIVITY_REBUILD_LOCK`` throughout: outbox batches, archiving and account
+deletion take it shared and wait until the rebuild is done. Each chunk reads
+from one snapshot and first applies the pending events that snapshot sees,
+so every event is counted exactly once: either in the rebuilt row or as a
+delta the worker applies after it.
+"""
+import logging
+import sys
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from database.db import ACTIVITY_REBUILD_LOCK, exclusive_lock, sessionLocal
+from database.models import ArchivedCommentAuthor, ArchivedThread, Comment, Post, PostActivity, User, UserActivity
+from utils.outbox import outbox_worker
+
+logger = logging.getLogger(__name__)
+
+
+def bump_user_activity(db: Session, user_id: int, comments: int = 0, received: int = 0, touch: bool = False):
+    values = {
+        "comments_count": UserActivity.comments_count + comments,
+        "comments_received": UserActivity.comments_received + received,
+    }
+    if touch:
+        values["last_activity_at"] = func.now()
+
+    result = db.execute(update(UserActivity).where(UserActivity.user_id == user_id).values(**values))
+    if result.rowcount == 0 and db.get(User, user_id) is not None:
+        db.add(UserActivity(
+            user_id=user_id,
+            comments_count=max(comments, 0),
+            comments_received=max(received, 0),
+            last_activity_at=func.now() if touch else None,
+        ))
+        db.flush()
+
+
+def post_owner_id(db: Session, post_id: int) -> Optional[int]:
+    return db.execute(select(Post.owner_id).where(Post.id == post_id)).scalar()
+
+
+def refresh_post_activity(db: Session, post_id: int, touch: bool = False):
+    archive = db.get(ArchivedThread, post_id)
+    if archive is not None:
+        # Once archived, the thread's comments only exist in the blob
+        commenters = len({row[1] for row in archive.comments})
+    else:
+        commenters = db.execute(
+            select(func.count(func.distinct(Comment.owner_id))).where(Comment.post_id == post_id)
+        ).scalar()
+    values = {"commenters_count": commenters}
+    if touch:
+        values["last_comment_at"] = func.now()
+
+    result = db.execute(update(PostActivity).where(PostActivity.post_id == post_id).values(**values))
+    if result.rowcount == 0 and db.get(Post, post_id) is not None:
+        db.add(PostActivity(
+            post_id=post_id,
+            commenters_count=commenters,
+            last_comment_at=func.now() if touch else None,
+        ))
+        db.flush()
+
+
+def archived_comment_totals(db: Session) -> Tuple[Counter, Counter]:
+    """Comments written and received inside archived threads for every user, from the author index."""
+    written = Counter(dict(db
+                           .query(ArchivedCommentAuthor.user_id, func.sum(ArchivedCommentAuthor.comment_count))
+                           .group_by(ArchivedCommentAuthor.user_id)
+                           .all()))
+    received = Counter(dict(db
+                            .query(Post.owner_id, func.sum(ArchivedCommentAuthor.comment_count))
+                            .join(Post, Post.id == ArchivedCommentAuthor.post_id)
+                            .filter(ArchivedCommentAuthor.user_id != Post.owner_id)
+                            .group_by(Post.owner_id)
+                            .all()))
+    return written, received
+
+
+def begin_chunk(db: Session):
+    """Start a chunk's transaction on one snapshot and fold in the events already committed before it."""
+    if db.get_bind().dialect.name == "postgresql":
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    outbox_worker.apply_pending(db)
+
+
+def grouped(db: Session, query) -> Dict[int, tuple]:
+    return {row[0]: tuple(row[1:]) for row in db.execute(query)}
+
+
+def rebuild_user_activity(db: Session, chunk_size: int = 500) -> int:
+    with exclusive_lock(ACTIVITY_REBUILD_LOCK, db.get_bind()):
+        # Archives cannot change while the lock is held, so one pass serves every chunk
+        archived_written, archived_received = archived_comment_totals(db)
+        db.commit()
+        return rebuild_user_chunks(db, chunk_size, archived_written, archived_received)
+
+
+def rebuild_user_chunks(db: Session, chunk_size: int, archived_written: Counter, archived_received: Counter) -> int:
+    rebuilt = 0
+    last_id = 0
+    while True:
+        begin_chunk(db)
+        user_ids = db.execute(
+            select(User.id).where(User.id > last_id).order_by(User.id).limit(chunk_size)
+        ).scalars().all()
+        if not user_ids:
+            db.commit()
+            break
+
+        posts = grouped(db, select(Post.owner_id, func.count(Post.id), func.max(Post.updated_at))
+                        .where(Post.owner_id.in_(user_ids))
+                        .group_by(Post.owner_id))
+        written = grouped(db, select(Comment.owner_id, func.count(Comment.id), func.max(Comment.updated_at))
+                          .where(Comment.owner_id.in_(user_ids))
+                          .group_by(Comment.owner_id))
+        received = grouped(db, select(Post.owner_id, func.count(Comment.id))
+                           .join(Comment, Comment.post_id == Post.id)
+                           .where(Post.owner_id.in_(user_ids), Comment.owner_id != Post.owner_id)
+                           .group_by(Post.owner_id))
+
+        db.query(UserActivity).filter(UserActivity.user_id.in_(user_ids)).delete(synchronize_session=False)
+        for user_id in user_ids:
+            post_count, last_post_at = posts.get(user_id, (0, None))
+            comment_count, last_comment_at = written.get(user_id, (0, None))
+            db.execute(update(User).where(User.id == user_id).values(total_posts=post_count))
+            db.add(UserActivity(
+                user_id=user_id,
+                comments_count=comment_count + archived_written[user_id],
+                comments_received=received.get(user_id, (0,))[0] + archived_received[user_id],
+                last_activity_at=max((t for t in (last_post_at, last_comment_at) if t is not None), default=None),
+            ))
+        db.commit()
+
+        rebuilt += len(user_ids)
+        last_id = user_ids[-1]
+    return rebuilt
+
+
+def rebuild_post_activity(db: Session, chunk_size: int = 500) -> int:
+    with exclusive_lock(ACTIVITY_REBUILD_LOCK, db.get_bind()):
+        return rebuild_post_chunks(db, chunk_size)
+
+
+def rebuild_post_chunks(db: Session, chunk_size: int) -> int:
+    rebuilt = 0
+    last_id = 0
+    while True:
+        begin_chunk(db)
+        post_ids = db.execute(
+            select(Post.id).where(Post.id > last_id).order_by(Post.id).limit(chunk_size)
+        ).scalars().all()
+        if not post_ids:
+            db.commit()
+            break
+
+        stats = grouped(db, select(Comment.post_id, func.count(func.distinct(Comment.owner_id)), func.max(Comment.created_at))
+                        .where(Comment.post_id.in_(post_ids))
+                        .group_by(Comment.post_id))
+        # Archived threads have no live comments; read their blob instead
+        for archive in db.query(ArchivedThread).filter(ArchivedThread.post_id.in_(post_ids)):
+            rows = archive.comments
+            stats[archive.post_id] = (
+                len({row[1] for row in rows}),
+                max((datetime.fromisoformat(row[3]) for row in rows), default=None),
+            )
+
+        db.query(PostActivity).filter(PostActivity.post_id.in_(post_ids)).delete(synchronize_session=False)
+        for post_id in post_ids:
+            commenters_count, last_comment_at = stats.get(post_id, (0, None))
+            db.add(PostActivity(post_id=post_id, commenters_count=commenters_count, last_comment_at=last_comment_at))
+        db.commit()
+
+        rebuilt += len(post_ids)
+        last_id = post_ids[-1]
+    return rebuilt
+
+
+def main():
+    chunk_size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    db = sessionLocal()
+    try:
+        users = rebuild_user_activity(db, chunk_size)
+        posts = rebuild_post_activity(db, chunk_size)
+    finally:
+        db.close()
+    logger.info("Rebuilt activity for %s users and %s posts", users, posts)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,192 @@
+"""Moves cold comment threads out of the comments table into ``archived_threads``.
+
+Run periodically (e.g. from cron)::
+
+    python -m utils.archive
+"""
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException, Response
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from starlette import status
+
+import schemas
+from config.config import setting
+from database.db import ACTIVITY_REBUILD_LOCK, hold_shared_lock, sessionLocal
+from database.models import ArchivedCommentAuthor, ArchivedThread, Comment, Post, User
+
+logger = logging.getLogger(__name__)
+
+
+def archive_thread(db: Session, post: Post):
+    rows = (db
+            .query(Comment.id, Comment.owner_id, Comment.comment, Comment.created_at, Comment.updated_at)
+            .filter(Comment.post_id == post.id)
+            .order_by(Comment.id)
+            .all())
+
+    db.add(ArchivedThread(
+        post_id=post.id,
+        comment_count=len(rows),
+        comments=[
+            [row.id, row.owner_id, row.comment, row.created_at.isoformat(), row.updated_at.isoformat()]
+            for row in rows
+        ],
+    ))
+    index_authors(db, post.id, (row.owner_id for row in rows))
+    # Bulk delete: the comment counter is unchanged, the comments just moved
+    (db
+     .query(Comment)
+     .filter(Comment.post_id == post.id)
+     .delete(synchronize_session=False))
+    post.archived = True
+
+
+def index_authors(db: Session, post_id: int, owner_ids):
+    for user_id, count in Counter(owner_ids).items():
+        db.add(ArchivedCommentAuthor(user_id=user_id, post_id=post_id, comment_count=count))
+
+
+def index_archived_authors(db: Session, chunk_size: int = 100) -> int:
+    """Build ``archived_comment_authors`` for threads archived before it existed, one chunk per transaction."""
+    indexed = 0
+    last_id = 0
+    while True:
+        threads = (db
+                   .query(ArchivedThread.post_id, ArchivedThread.comments)
+                   .filter(ArchivedThread.post_id > last_id)
+                   .order_by(ArchivedThread.post_id)
+                   .limit(chunk_size)
+                   .all())
+        if not threads:
+            break
+        post_ids = [post_id for post_id, _ in threads]
+        db.query(ArchivedCommentAuthor).filter(ArchivedCommentAuthor.post_id.in_(post_ids)).delete(synchronize_session=False)
+        for post_id, rows in threads:
+            index_authors(db, post_id, (row[1] for row in rows))
+        db.commit()
+        indexed += len(threads)
+        last_id = post_ids[-1]
+    return indexed
+
+
+def archive_cold_threads(
+        db: Session,
+        older_than_days: int = setting.COMMENT_ARCHIVE_AFTER_DAYS,
+        batch_size: int = setting.COMMENT_ARCHIVE_BATCH_SIZE,
+    ) -> int:
+    """Archive one batch of threads whose post is older than the threshold; returns how many."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    hold_shared_lock(db, ACTIVITY_REBUILD_LOCK)
+    posts = (db
+             .query(Post)
+             .filter(Post.archived.is_(False), Post.created_at < cutoff)
+             .order_by(Post.id)
+             .limit(batch_size)
+             .with_for_update(skip_locked=True)
+             .all())
+
+    for post in posts:
+        archive_thread(db, post)
+    db.commit()
+    return len(posts)
+
+
+def remove_user_comments(db: Session, user_id: int) -> Dict[int, int]:
+    """Strip a deleted account's comments from other users' archived threads; returns removed counts per post."""
+    hold_shared_lock(db, ACTIVITY_REBUILD_LOCK)
+    authored = (db
+                .query(ArchivedCommentAuthor)
+                .join(Post, Post.id == ArchivedCommentAuthor.post_id)
+                .filter(ArchivedCommentAuthor.user_id == user_id, Post.owner_id != user_id)
+                .all())
+
+    removed = {}
+    for author in authored:
+        archive = (db
+                   .query(ArchivedThread)
+                   .filter(ArchivedThread.post_id == author.post_id)
+                   .with_for_update()
+                   .one())
+        kept = [row for row in archive.comments if row[1] != user_id]
+        removed[author.post_id] = len(archive.comments) - len(kept)
+        archive.comments = kept
+        archive.comment_count = len(kept)
+        db.delete(author)
+    return removed
+
+
+def archived_commenters(db: Session, owner_id: int) -> Counter:
+    """Comments other users left in the archived threads of ``owner_id``'s posts."""
+    return Counter(dict(db
+                        .query(ArchivedCommentAuthor.user_id, func.sum(ArchivedCommentAuthor.comment_count))
+                        .join(Post, Post.id == ArchivedCommentAuthor.post_id)
+                        .filter(Post.owner_id == owner_id, ArchivedCommentAuthor.user_id != owner_id)
+                        .group_by(ArchivedCommentAuthor.user_id)
+                        .all()))
+
+
+def archived_comment_page(
+        db: Session,
+        post: Post,
+        response: Response,
+        page_number: int,
+        page_size: int,
+        search: Optional[str],
+        detail: str,
+    ) -> List[schemas.CommentWithUserDetails]:
+    rows = post.archive.comments if post.archive is not None else []
+    if search:
+        needle = search.lower()
+        rows = [row for row in rows if needle in row[2].lower()]
+
+    if page_number * page_size > len(rows):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=detail
+        )
+
+    page = rows[page_number * page_size:(page_number + 1) * page_size]
+    owners = {
+        owner.id: owner
+        for owner in db.query(User).filter(User.id.in_({row[1] for row in page}))
+    }
+
+    response.headers["X-Total-Count"] = str(len(rows))
+    return [
+        schemas.CommentWithUserDetails(
+            id=row[0],
+            comment=row[2],
+            owner=schemas.User(
+                id=owners[row[1]].id,
+                username=owners[row[1]].username,
+                email=owners[row[1]].email,
+            ),
+        )
+        for row in page
+        # Comments by since-deleted users stay in the blob but are not shown
+        if row[1] in owners
+    ]
+
+
+def main():
+    total = 0
+    db = sessionLocal()
+    try:
+        while True:
+            archived = archive_cold_threads(db)
+            total += archived
+            if archived < setting.COMMENT_ARCHIVE_BATCH_SIZE:
+                break
+    finally:
+        db.close()
+    logger.info("Archived %s threads", total)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -1,8 +1,19 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from typing import Annotated, Any, Dict
-from fastapi import Cookie, HTTPException
+from typing import Annotated, Any, Dict, Optional
+from fastapi import Cookie, Header, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from database.models import User
+from sqlalchemy.orm import Session
+from database.db import sessionLocal
+from database.models import RevokedToken, User
+from utils.periodic import PeriodicTask, delete_in_batches
 from jose import jwt, JWTError
 from starlette import status
 from pwdlib import PasswordHash
@@ -11,12 +22,152 @@ from config.config import setting
 password_hash = PasswordHash.recommended()
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl="users/token")
 
+logger = logging.getLogger(__name__)
+
 SECRET_KEY = setting.JWT_SECRET
 ALGORITHM = setting.JWT_ALGORITHM
 
 
+class VerifiedTokenCache:
+    """LRU of already-verified tokens, keyed by digest and dropped at the token's ``exp``."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[bytes, tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest: bytes) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at <= time.time():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return user
+
+    def put(self, digest: bytes, user: dict, expires_at: float):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[digest] = (expires_at, user)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, digest: bytes):
+        with self._lock:
+            self._entries.pop(digest, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TokenRevocationList:
+    """This worker's copy of the revoked token digests, kept only until the token would have expired anyway.
+
+    ``revoked_tokens`` rows are the shared source; ``RevocationSync`` polls them in.
+    """
+
+    def __init__(self):
+        self._revoked: Dict[bytes, float] = {}
+        self._next_purge = 0.0
+
+    def __contains__(self, digest: bytes) -> bool:
+        return digest in self._revoked
+
+    def revoke(self, digest: bytes, expires_at: float):
+        self._revoked[digest] = expires_at
+        self.purge()
+
+    def purge(self):
+        now = time.time()
+        if now < self._next_purge:
+            return
+        self._next_purge = now + 60
+        for digest, expires_at in list(self._revoked.items()):
+            if expires_at <= now:
+                self._revoked.pop(digest, None)
+
+
+verified_tokens = VerifiedTokenCache(setting.JWT_CACHE_SIZE)
+revoked_tokens = TokenRevocationList()
+
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+def forget_token(digest: bytes, expires_at: float):
+    revoked_tokens.revoke(digest, expires_at)
+    verified_tokens.discard(digest)
+
+
+def revoke_token(db: Session, token: str):
+    """Revoke at once in this worker; the others pick it up on their next ``RevocationSync`` poll."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return
+
+    digest = token_digest(token)
+    expires_at = float(payload.get("exp", time.time()))
+    db.merge(RevokedToken(
+        digest=digest.hex(),
+        expires_at=datetime.fromtimestamp(expires_at, timezone.utc),
+    ))
+    db.commit()
+    forget_token(digest, expires_at)
+
+
+class RevocationSync(PeriodicTask):
+    """Polls ``revoked_tokens`` into this worker's in-memory list and drops expired rows."""
+
+    def __init__(
+            self,
+            interval: float = setting.TOKEN_REVOCATION_SYNC_INTERVAL_SECONDS,
+            purge_batch_size: int = 500,
+        ):
+        super().__init__(interval)
+        self.purge_batch_size = purge_batch_size
+        self._synced_at: Optional[datetime] = None
+
+    def run_once(self) -> int:
+        started = datetime.now(timezone.utc)
+        db = sessionLocal()
+        try:
+            query = db.query(RevokedToken.digest, RevokedToken.expires_at).filter(RevokedToken.expires_at > started)
+            if self._synced_at is not None:
+                # Overlap the previous poll so a revocation committed while it ran, or
+                # stamped by a database clock slightly behind ours, is never skipped
+                query = query.filter(RevokedToken.revoked_at >= self._synced_at - timedelta(seconds=60))
+            synced = 0
+            for digest, expires_at in query:
+                if expires_at.tzinfo is None:
+                    expires_at = expires_at.replace(tzinfo=timezone.utc)
+                forget_token(bytes.fromhex(digest), expires_at.timestamp())
+                synced += 1
+
+            delete_in_batches(db, RevokedToken, RevokedToken.expires_at <= started, batch_size=self.purge_batch_size)
+        finally:
+            db.close()
+        self._synced_at = started
+        return synced
+
+    async def tick(self) -> bool:
+        await asyncio.to_thread(self.run_once)
+        return False
+
+
+revocation_sync = RevocationSync()
+
+
 def create_access_token(username: str, user_id: str, expires_delta: timedelta):
-    encode: Dict[Any, Any] = {"sub": username, "id": user_id}
+    # jti keeps tokens issued in the same second distinct for revocation
+    encode: Dict[Any, Any] = {"sub": username, "id": user_id, "jti": uuid.uuid4().hex}
 
     expires = datetime.now(timezone.utc) + expires_delta
     encode.update({"exp": expires})
@@ -35,6 +186,17 @@ def authenticate_user(username: str, password: str, db):
     return user_model
 
 async def get_current_user(token:Annotated[str, Cookie()]):
+    digest = token_digest(token)
+    if digest in revoked_tokens:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid credentials",
+        )
+
+    user = verified_tokens.get(digest)
+    if user is not None:
+        return user
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -46,9 +208,25 @@ async def get_current_user(token:Annotated[str, Cookie()]):
                 detail="Invalid credentials",
             )
 
-        return {"username": username, "id": user_id}
+        user = {"username": username, "id": user_id}
+        if "exp" in payload:
+            verified_tokens.put(digest, user, float(payload["exp"]))
+        return user
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
-        )
\ No newline at end of file
+        )
+
+async def get_admin(x_admin_token: Annotated[Optional[str], Header()] = None):
+    if setting.ADMIN_TOKEN is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Not found",
+        )
+
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token, setting.ADMIN_TOKEN):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid admin token",
+        )
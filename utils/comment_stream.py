@@ -0,0 +1,116 @@
+import abc
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, Optional, Set
+
+from config.config import setting
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[str, str], None]
+
+
+class Broker(abc.ABC):
+    """Carries published messages to every worker process.
+
+    The hub hands the broker a ``deliver`` callback; a broker for a
+    multi-worker deployment (e.g. Redis pub/sub) publishes to its backend
+    and calls ``deliver`` for every message it receives back.
+    """
+
+    def bind(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    @abc.abstractmethod
+    async def publish(self, channel: str, message: str) -> None:
+        ...
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+
+class LocalBroker(Broker):
+    """Single-process stand-in that delivers straight back to the hub."""
+
+    async def publish(self, channel: str, message: str) -> None:
+        self._deliver(channel, message)
+
+
+class Subscription:
+    def __init__(self, channel: str, buffer_size: int):
+        self.channel = channel
+        self.queue: asyncio.Queue[Optional[str]] = asyncio.Queue(maxsize=buffer_size)
+        self.closed = False
+
+    def push(self, message: str) -> bool:
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            self.close()
+            return False
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        # Drop whatever is still buffered so the close marker always fits
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[str]:
+        """Next message, ``None`` once closed; raises ``asyncio.TimeoutError`` when idle."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class CommentHub:
+    def __init__(self, broker: Broker, buffer_size: int):
+        self.buffer_size = buffer_size
+        self.subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+        self.slow_consumer_disconnects = 0
+        self.set_broker(broker)
+
+    def set_broker(self, broker: Broker) -> None:
+        self.broker = broker
+        self.broker.bind(self.dispatch)
+
+    def subscribe(self, post_id: int) -> Subscription:
+        subscription = Subscription(self.channel(post_id), self.buffer_size)
+        self.subscribers[subscription.channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self.subscribers.get(subscription.channel)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self.subscribers[subscription.channel]
+
+    async def publish(self, post_id: int, message: str) -> None:
+        try:
+            await self.broker.publish(self.channel(post_id), message)
+        except Exception:
+            # A broker outage must never fail the write that triggered it
+            logger.exception("Failed to publish comment event for post %s", post_id)
+
+    def dispatch(self, channel: str, message: str) -> None:
+        for subscription in list(self.subscribers.get(channel, ())):
+            if not subscription.push(message):
+                self.slow_consumer_disconnects += 1
+                logger.warning("Disconnected slow subscriber on %s", channel)
+                self.unsubscribe(subscription)
+
+    @staticmethod
+    def channel(post_id: int) -> str:
+        return f"post:{post_id}:comments"
+
+
+comment_hub = CommentHub(LocalBroker(), setting.COMMENT_STREAM_BUFFER_SIZE)
@@ -0,0 +1,109 @@
+"""Maintained counters and their one-off backfill.
+
+Recount every counter from the rows themselves, e.g. after upgrading a
+database created before the counters existed::
+
+    python -m utils.counters [chunk_size]
+"""
+import logging
+import sys
+from typing import Optional
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.orm import Session
+
+from database.db import sessionLocal
+from database.models import ArchivedThread, Comment, Counter, Post, User
+
+logger = logging.getLogger(__name__)
+
+
+def get_counter(db: Session, name: str) -> Optional[int]:
+    return db.execute(select(Counter.value).where(Counter.name == name)).scalar()
+
+
+def adjust_counter(db: Session, name: str, delta: int):
+    db.execute(
+        update(Counter)
+        .where(Counter.name == name)
+        .values(value=Counter.value + delta)
+    )
+
+
+def estimated_row_count(db: Session, table_name: str) -> Optional[int]:
+    """Planner estimate from pg_class; ``None`` on other databases or before the first ANALYZE."""
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    estimate = db.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE relname = :name"),
+        {"name": table_name},
+    ).scalar()
+    if estimate is None or estimate < 0:
+        return None
+    return estimate
+
+
+def total_posts(db: Session) -> Optional[int]:
+    count = get_counter(db, "posts")
+    if count is None:
+        count = estimated_row_count(db, "posts")
+    return count
+
+
+
+def backfill_counters(db: Session, chunk_size: int = 500) -> int:
+    """Recount ``users.total_posts``, ``posts.total_comments`` and the ``posts`` counter, one chunk per transaction."""
+    last_id = 0
+    users = 0
+    while True:
+        user_ids = db.execute(
+            select(User.id).where(User.id > last_id).order_by(User.id).limit(chunk_size)
+        ).scalars().all()
+        if not user_ids:
+            break
+        db.execute(
+            update(User)
+            .where(User.id.in_(user_ids))
+            .values(total_posts=select(func.count(Post.id)).where(Post.owner_id == User.id).scalar_subquery())
+        )
+        db.commit()
+        users += len(user_ids)
+        last_id = user_ids[-1]
+
+    last_id = 0
+    while True:
+        post_ids = db.execute(
+            select(Post.id).where(Post.id > last_id).order_by(Post.id).limit(chunk_size)
+        ).scalars().all()
+        if not post_ids:
+            break
+        live = select(func.count(Comment.id)).where(Comment.post_id == Post.id).scalar_subquery()
+        archived = select(ArchivedThread.comment_count).where(ArchivedThread.post_id == Post.id).scalar_subquery()
+        db.execute(
+            update(Post)
+            .where(Post.id.in_(post_ids))
+            .values(total_comments=live + func.coalesce(archived, 0))
+        )
+        db.commit()
+        last_id = post_ids[-1]
+
+    posts = db.execute(select(func.count(Post.id))).scalar()
+    if db.execute(update(Counter).where(Counter.name == "posts").values(value=posts)).rowcount == 0:
+        db.add(Counter(name="posts", value=posts))
+    db.commit()
+    return users
+
+
+def main():
+    chunk_size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    db = sessionLocal()
+    try:
+        users = backfill_counters(db, chunk_size)
+    finally:
+        db.close()
+    logger.info("Recounted counters for %s users and all posts", users)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
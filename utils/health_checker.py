@@ -0,0 +1,110 @@
+import asyncio
+import math
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import create_engine, make_url, text
+from sqlalchemy.pool import NullPool
+
+from config.config import setting
+from database.db import engine
+from utils.periodic import PeriodicTask
+
+
+def ping(target_engine) -> None:
+    with target_engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+def probe_engine(url: str, timeout: float):
+    """An engine of its own for health pings, so a hung database never holds the app's pooled connections.
+
+    The driver enforces the timeout too: ``asyncio.wait_for`` gives up on a
+    ping but cannot stop the thread that is still waiting on it.
+    """
+    backend = make_url(url).get_backend_name()
+    if backend == "postgresql":
+        connect_args = {
+            "connect_timeout": max(1, math.ceil(timeout)),
+            "options": f"-c statement_timeout={int(timeout * 1000)}",
+        }
+    elif backend == "sqlite":
+        connect_args = {"timeout": timeout}
+    else:
+        connect_args = {}
+    return create_engine(url, poolclass=NullPool, connect_args=connect_args)
+
+
+class HealthChecker(PeriodicTask):
+    """Refreshes dependency status in the background so probes only read cached state."""
+
+    def __init__(
+        self,
+        interval: float = setting.HEALTH_CHECK_INTERVAL_SECONDS,
+        timeout: float = setting.HEALTH_CHECK_TIMEOUT_SECONDS,
+        stale_after: float = setting.HEALTH_STALE_AFTER_SECONDS,
+        replica_url: Optional[str] = setting.DATABASE_REPLICA_URL,
+    ):
+        super().__init__(interval)
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self.database_engine = probe_engine(setting.DATABASE_URL, timeout)
+        self.replica_engine = probe_engine(replica_url, timeout) if replica_url else None
+        self.state: Dict[str, Any] = {"database": {"status": "unknown"}, "checked_at": None}
+        self._pings: Dict[str, asyncio.Future] = {}
+
+    async def _check(self, name: str, target_engine) -> Dict[str, Any]:
+        previous = self._pings.get(name)
+        if previous is not None and not previous.done():
+            # Never stack another blocked thread behind a ping that is still hanging
+            return {"status": "timeout", "error": "previous check still running"}
+
+        start = time.perf_counter()
+        self._pings[name] = pending = asyncio.ensure_future(asyncio.to_thread(ping, target_engine))
+        try:
+            await asyncio.wait_for(asyncio.shield(pending), self.timeout)
+            return {"status": "connected", "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+        except asyncio.TimeoutError:
+            return {"status": "timeout", "error": f"no response within {self.timeout}s"}
+        except Exception as e:
+            return {"status": "disconnected", "error": str(e)}
+
+    async def refresh(self):
+        state: Dict[str, Any] = {"database": await self._check("database", self.database_engine)}
+        pool = engine.pool
+        state["pool"] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        }
+        if self.replica_engine is not None:
+            state["replica"] = await self._check("replica", self.replica_engine)
+        state["checked_at"] = time.time()
+        # Swap the whole dict so probes never see a half-updated snapshot
+        self.state = state
+
+    def snapshot(self) -> Dict[str, Any]:
+        state = self.state
+        checked_at = state.get("checked_at")
+        age = None if checked_at is None else time.time() - checked_at
+        stale = age is None or age > self.stale_after
+        ready = not stale and state["database"]["status"] == "connected"
+        return {
+            **state,
+            "age_seconds": None if age is None else round(age, 3),
+            "stale": stale,
+            "ready": ready,
+        }
+
+    async def tick(self) -> bool:
+        await self.refresh()
+        return False
+
+    async def stop(self):
+        await super().stop()
+        self.database_engine.dispose()
+        if self.replica_engine is not None:
+            self.replica_engine.dispose()
+
+
+health_checker = HealthChecker()
@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette import status
+
+from config.config import setting
+from database.db import sessionLocal
+from database.models import IdempotencyKey
+from utils.periodic import PeriodicTask, delete_in_batches
+
+logger = logging.getLogger(__name__)
+
+
+def request_fingerprint(route: str, body: BaseModel) -> str:
+    return hashlib.sha256(f"{route}\n{body.model_dump_json()}".encode()).hexdigest()
+
+
+def replay(db: Session, user_id: int, key: Optional[str], fingerprint: str) -> Optional[JSONResponse]:
+    """The stored response for a key already seen, or ``None`` if the request should run."""
+    if key is None:
+        return None
+
+    now = datetime.now(timezone.utc)
+    # An expired key the cleaner hasn't reached yet must not block reuse
+    (db
+     .query(IdempotencyKey)
+     .filter(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key, IdempotencyKey.expires_at <= now)
+     .delete(synchronize_session=False))
+
+    record = (db
+              .query(IdempotencyKey)
+              .filter(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+              .first())
+    if record is None:
+        return None
+
+    if record.fingerprint != fingerprint:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Idempotency-Key was already used for a different request"
+        )
+
+    return JSONResponse(
+        content=json.loads(record.response_body),
+        status_code=record.status_code,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def reserve(
+        db: Session,
+        user_id: int,
+        key: Optional[str],
+        fingerprint: str,
+    ) -> Tuple[Optional[IdempotencyKey], Optional[JSONResponse]]:
+    """Claim the key in the caller's transaction, or return the stored response of whoever claimed it first.
+
+    A concurrent retry blocks on the unique index until the original request
+    finishes. If the original committed, its response is replayed to the retry.
+    """
+    if key is None:
+        return None, None
+
+    record = IdempotencyKey(
+        user_id=user_id,
+        key=key,
+        fingerprint=fingerprint,
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=setting.IDEMPOTENCY_KEY_TTL_SECONDS),
+    )
+    db.add(record)
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        # The original committed its response together with the key; read it in a fresh transaction
+        replayed = replay(db, user_id, key, fingerprint)
+        if replayed is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A concurrent request with this Idempotency-Key did not complete; retry it"
+            )
+        return None, replayed
+    return record, None
+
+
+def complete(record: Optional[IdempotencyKey], status_code: int, response: BaseModel):
+    """Store the response on the reserved key.
+
+    The caller commits it together with the write it answers, so a retry can
+    never find the key without the post/comment or the other way round.
+    """
+    if record is None:
+        return
+    record.status_code = status_code
+    record.response_body = response.model_dump_json()
+
+
+def purge_expired(
+        db: Session,
+        batch_size: int = setting.IDEMPOTENCY_CLEANUP_BATCH_SIZE,
+        max_batches: int = setting.IDEMPOTENCY_CLEANUP_MAX_BATCHES,
+    ) -> int:
+    """Delete expired keys, at most ``max_batches`` batches per run."""
+    return delete_in_batches(
+        db, IdempotencyKey, IdempotencyKey.expires_at <= datetime.now(timezone.utc),
+        batch_size=batch_size, max_batches=max_batches,
+    )
+
+
+class ExpiredKeyCleaner(PeriodicTask):
+    def __init__(self, interval: float = setting.IDEMPOTENCY_CLEANUP_INTERVAL_SECONDS):
+        super().__init__(interval)
+
+    def run_once(self) -> int:
+        db = sessionLocal()
+        try:
+            return purge_expired(db)
+        finally:
+            db.close()
+
+    async def tick(self) -> bool:
+        deleted = await asyncio.to_thread(self.run_once)
+        if deleted:
+            logger.info("Purged %s expired idempotency keys", deleted)
+        return False
+
+
+expired_key_cleaner = ExpiredKeyCleaner()
@@ -0,0 +1,41 @@
+import os
+import time
+from collections import Counter
+from typing import Any, Dict
+
+from database.db import engine
+
+
+class WorkerMetrics:
+    """Request counters for the current worker process."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.started_at = time.time()
+        self.requests = 0
+        self.in_flight = 0
+        self.responses: Counter = Counter()
+        self.request_seconds = 0.0
+
+    def reset_for_fork(self):
+        # Counters inherited from a preloading parent belong to the parent
+        self.__init__()
+
+    def snapshot(self) -> Dict[str, Any]:
+        pool = engine.pool
+        return {
+            "pid": self.pid,
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "responses": dict(self.responses),
+            "avg_request_ms": round(self.request_seconds / self.requests * 1000, 3) if self.requests else None,
+            "pool": {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+            },
+        }
+
+
+worker_metrics = WorkerMetrics()
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import signal
+import time
+from datetime import datetime, timedelta, timezone
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from config.config import setting
+from database.db import ACTIVITY_REBUILD_LOCK, hold_shared_lock, sessionLocal
+from database.models import OutboxEvent
+from utils.periodic import PeriodicTask, delete_in_batches
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Session, Dict[str, Any]], None]
+handlers: Dict[str, List[Handler]] = defaultdict(list)
+
+
+def handler(*topics: str):
+    def register(fn: Handler) -> Handler:
+        for topic in topics:
+            handlers[topic].append(fn)
+        return fn
+    return register
+
+
+def enqueue(db: Session, topic: str, payload: Dict[str, Any]):
+    """Stage an event in the caller's transaction; it is only visible to the worker once committed."""
+    db.add(OutboxEvent(topic=topic, payload=payload))
+
+
+def purge_done(
+        db: Session,
+        retention: float = setting.OUTBOX_RETENTION_SECONDS,
+        batch_size: int = setting.OUTBOX_PURGE_BATCH_SIZE,
+        max_batches: int = setting.OUTBOX_PURGE_MAX_BATCHES,
+    ) -> int:
+    """Delete processed events older than ``retention`` seconds in short batches; failed ones are kept."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=retention)
+    return delete_in_batches(
+        db, OutboxEvent, OutboxEvent.status == "done", OutboxEvent.updated_at <= cutoff,
+        batch_size=batch_size, max_batches=max_batches,
+    )
+
+
+class OutboxWorker(PeriodicTask):
+    def __init__(
+        self,
+        session_factory=sessionLocal,
+        batch_size: int = setting.OUTBOX_BATCH_SIZE,
+        poll_interval: float = setting.OUTBOX_POLL_INTERVAL_SECONDS,
+        max_attempts: int = setting.OUTBOX_MAX_ATTEMPTS,
+        retry_backoff: float = setting.OUTBOX_RETRY_BACKOFF_SECONDS,
+        purge_interval: float = setting.OUTBOX_PURGE_INTERVAL_SECONDS,
+    ):
+        super().__init__(poll_interval)
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.purge_interval = purge_interval
+        self._last_purge: Optional[float] = None
+
+    def process_batch(self) -> int:
+        # Handlers share the batch transaction, so their writes and the "done"
+        # marker commit together and a retried event never applies twice.
+        db = self.session_factory()
+        try:
+            # Waits while an activity rebuild runs, so its counters are never overwritten under a delta
+            hold_shared_lock(db, ACTIVITY_REBUILD_LOCK)
+            events = (db
+                      .query(OutboxEvent)
+                      .filter(OutboxEvent.status == "pending", OutboxEvent.available_at <= func.now())
+                      .order_by(OutboxEvent.id)
+                      .limit(self.batch_size)
+                      .with_for_update(skip_locked=True)
+                      .all())
+
+            for event in events:
+                self._process_event(db, event)
+
+            db.commit()
+            return len(events)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def apply_pending(self, db: Session) -> int:
+        """Apply every pending event inside the caller's transaction, ignoring retry backoff.
+
+        For maintenance jobs that hold ``ACTIVITY_REBUILD_LOCK``, which keeps the
+        worker out meanwhile; the caller commits.
+        """
+        import utils.outbox_handlers  # noqa: F401
+
+        events = (db
+                  .query(OutboxEvent)
+                  .filter(OutboxEvent.status == "pending")
+                  .order_by(OutboxEvent.id)
+                  .all())
+        for event in events:
+            self._process_event(db, event)
+        return len(events)
+
+    def purge_once(self) -> int:
+        db = self.session_factory()
+        try:
+            return purge_done(db)
+        finally:
+            db.close()
+
+    def _process_event(self, db: Session, event: OutboxEvent):
+        topic_handlers = handlers.get(event.topic)
+        if not topic_handlers:
+            event.status = "done"
+            return
+
+        savepoint = db.begin_nested()
+        try:
+            for fn in topic_handlers:
+                fn(db, event.payload)
+            savepoint.commit()
+            event.status = "done"
+        except Exception as e:
+            savepoint.rollback()
+            event.attempts += 1
+            event.last_error = str(e)[:500]
+            if event.attempts >= self.max_attempts:
+                event.status = "failed"
+                logger.error("Outbox event %s (%s) failed permanently: %s", event.id, event.topic, e)
+            else:
+                delay = self.retry_backoff * 2 ** (event.attempts - 1)
+                event.available_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+                logger.warning("Outbox event %s (%s) failed, retrying in %.1fs", event.id, event.topic, delay)
+
+    async def run(self):
+        # Handlers register themselves on import
+        import utils.outbox_handlers  # noqa: F401
+
+        self._last_purge = None
+        await super().run()
+
+    async def tick(self) -> bool:
+        try:
+            processed = await asyncio.to_thread(self.process_batch)
+        except Exception:
+            logger.exception("Outbox batch failed")
+            processed = 0
+
+        if self._last_purge is None or time.monotonic() - self._last_purge >= self.purge_interval:
+            self._last_purge = time.monotonic()
+            try:
+                purged = await asyncio.to_thread(self.purge_once)
+                if purged:
+                    logger.info("Purged %s processed outbox events", purged)
+            except Exception:
+                logger.exception("Outbox purge failed")
+
+        # A full batch means there is likely more waiting; drain it straight away
+        return processed >= self.batch_size
+
+
+outbox_worker = OutboxWorker()
+
+
+async def main():
+    outbox_worker.start()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, outbox_worker.request_stop)
+    logger.info("Outbox worker started")
+    await outbox_worker.wait()
+
+
+if __name__ == "__main__":
+    # Run through the importable module so handlers register on the same registry
+    from utils import outbox
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(outbox.main())
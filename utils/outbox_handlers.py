@@ -0,0 +1,77 @@
+from sqlalchemy import func, select, update
+
+from database.models import ArchivedThread, Comment, Post, User
+from utils.activity import bump_user_activity, post_owner_id, refresh_post_activity
+from utils.counters import adjust_counter
+from utils.outbox import handler
+
+
+@handler("comment.created", "comment.deleted")
+def refresh_post_comment_count(db, payload):
+    # Recounting instead of incrementing keeps the counter exact even after retries or cascades
+    post_id = payload["post_id"]
+    live = select(func.count(Comment.id)).where(Comment.post_id == post_id).scalar_subquery()
+    archived = select(ArchivedThread.comment_count).where(ArchivedThread.post_id == post_id).scalar_subquery()
+    db.execute(
+        update(Post)
+        .where(Post.id == post_id)
+        .values(total_comments=live + func.coalesce(archived, 0))
+    )
+
+
+def refresh_user_post_count(db, owner_id):
+    db.execute(
+        update(User)
+        .where(User.id == owner_id)
+        .values(total_posts=select(func.count(Post.id)).where(Post.owner_id == owner_id).scalar_subquery())
+    )
+
+
+@handler("post.created")
+def count_created_post(db, payload):
+    refresh_user_post_count(db, payload["owner_id"])
+    adjust_counter(db, "posts", 1)
+
+
+@handler("post.deleted")
+def count_deleted_post(db, payload):
+    refresh_user_post_count(db, payload["owner_id"])
+    adjust_counter(db, "posts", -1)
+
+
+@handler("user.deleted")
+def count_deleted_user_posts(db, payload):
+    adjust_counter(db, "posts", -payload["posts"])
+
+
+@handler("post.created", "post.updated", "comment.updated")
+def touch_user_activity(db, payload):
+    bump_user_activity(db, payload["owner_id"], touch=True)
+
+
+@handler("comment.created")
+def record_created_comment(db, payload):
+    bump_user_activity(db, payload["owner_id"], comments=1, touch=True)
+    owner_id = post_owner_id(db, payload["post_id"])
+    if owner_id is not None and owner_id != payload["owner_id"]:
+        bump_user_activity(db, owner_id, received=1)
+    refresh_post_activity(db, payload["post_id"], touch=True)
+
+
+@handler("comment.deleted")
+def record_deleted_comment(db, payload):
+    count = payload.get("count", 1)
+    bump_user_activity(db, payload["owner_id"], comments=-count)
+    owner_id = post_owner_id(db, payload["post_id"])
+    if owner_id is not None and owner_id != payload["owner_id"]:
+        bump_user_activity(db, owner_id, received=-count)
+    refresh_post_activity(db, payload["post_id"])
+
+
+@handler("post.deleted", "user.deleted")
+def record_removed_comments(db, payload):
+    # Comments that went with a deleted post or account no longer count for their authors
+    for commenter_id, count in payload.get("commenters", {}).items():
+        bump_user_activity(db, int(commenter_id), comments=-count)
+    if "received" in payload:
+        bump_user_activity(db, payload["owner_id"], received=-payload["received"])
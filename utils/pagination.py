@@ -0,0 +1,40 @@
+from typing import Optional
+
+from fastapi import HTTPException, Response
+from starlette import status
+
+
+def paginate(
+        query,
+        response: Response,
+        page_number: int,
+        page_size: int,
+        total_count: Optional[int],
+        exact_count: bool = False,
+        detail: str = "You have reached the limit",
+    ):
+    """Fetch one page, validating ``page_number`` against a maintained or estimated total.
+
+    A ``count(*)`` only runs when the caller asks for ``exact_count``. Without any
+    total (e.g. filtered listings) an empty page past the first is the out-of-range signal.
+    """
+    if exact_count:
+        total_count = query.order_by(None).count()
+
+    if total_count is not None and page_number * page_size > total_count:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=detail
+        )
+
+    items = query.offset(page_number * page_size).limit(page_size).all()
+
+    if total_count is None and page_number > 0 and not items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=detail
+        )
+
+    if total_count is not None:
+        response.headers["X-Total-Count"] = str(total_count)
+    return items
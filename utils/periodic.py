@@ -0,0 +1,75 @@
+"""Building blocks for the background jobs that run inside each worker."""
+import abc
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+def delete_in_batches(db: Session, model, *criteria, batch_size: int, max_batches: int = 1) -> int:
+    """Delete the rows matching ``criteria`` in short transactions of at most ``batch_size`` rows.
+
+    Stops after ``max_batches`` so one run never holds the table for long;
+    whatever is left goes on the next run.
+    """
+    key = inspect(model).primary_key[0]
+    deleted = 0
+    for _ in range(max_batches):
+        ids = [row[0] for row in db.query(key).filter(*criteria).limit(batch_size)]
+        if not ids:
+            break
+        db.query(model).filter(key.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            break
+    return deleted
+
+
+class PeriodicTask(abc.ABC):
+    """Runs ``tick`` on the event loop every ``interval`` seconds until stopped."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @abc.abstractmethod
+    async def tick(self) -> bool:
+        """One round of work; return ``True`` to start the next round without waiting."""
+
+    async def run(self):
+        while not self._stopping.is_set():
+            try:
+                busy = await self.tick()
+            except Exception:
+                logger.exception("%s failed", type(self).__name__)
+                busy = False
+            if not busy:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def start(self):
+        # A fresh event per start, bound to the loop that is running now: an event
+        # made at import would stay tied to the first loop and break a second lifespan
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+
+    def request_stop(self):
+        """Ask the task to finish its current round and exit; safe to call from a signal handler."""
+        self._stopping.set()
+
+    async def wait(self):
+        if self._task is not None:
+            await self._task
+
+    async def stop(self):
+        self.request_stop()
+        await self.wait()
+        self._task = None
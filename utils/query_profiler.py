@@ -0,0 +1,177 @@
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config.config import setting
+
+logger = logging.getLogger(__name__)
+
+# Per-request state, set by QueryProfilerMiddleware
+current_scope: ContextVar[Optional[dict]] = ContextVar("query_profiler_scope", default=None)
+current_statements: ContextVar[Optional[Counter]] = ContextVar("query_profiler_statements", default=None)
+_explaining: ContextVar[bool] = ContextVar("query_profiler_explaining", default=False)
+
+
+def route_name(scope: Optional[dict]) -> str:
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    path = route.path if route is not None else scope.get("path", "")
+    return f"{scope.get('method', '')} {path}".strip()
+
+
+def parameter_shape(parameters, executemany: bool):
+    """Types of the bound parameters, never their values."""
+    if executemany:
+        return f"executemany[{len(parameters)}]"
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+class QueryProfiler:
+    def __init__(
+        self,
+        threshold_ms: float = setting.QUERY_PROFILER_THRESHOLD_MS,
+        explain_sample_rate: float = setting.QUERY_PROFILER_EXPLAIN_SAMPLE_RATE,
+        explain_timeout_ms: int = setting.QUERY_PROFILER_EXPLAIN_TIMEOUT_MS,
+        n_plus_one_threshold: int = setting.QUERY_PROFILER_N_PLUS_ONE_THRESHOLD,
+        max_entries: int = 500,
+        max_pending_explains: int = 10,
+    ):
+        self.threshold_ms = threshold_ms
+        self.explain_sample_rate = explain_sample_rate
+        self.explain_timeout_ms = explain_timeout_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.max_entries = max_entries
+        self.max_pending_explains = max_pending_explains
+        self.slow_queries: Dict[tuple, Dict[str, Any]] = {}
+        self.n_plus_one: Dict[tuple, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        # One background thread, so EXPLAINs never compete with requests for more than one connection
+        self._explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-explain")
+        self._pending_explains = 0
+
+    def install(self, engine: Engine):
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._query_profiler_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration_ms = (time.perf_counter() - context._query_profiler_start) * 1000
+        if _explaining.get():
+            return
+
+        statements = current_statements.get()
+        if statements is not None:
+            statements[statement] += 1
+
+        if duration_ms < self.threshold_ms:
+            return
+
+        route = route_name(current_scope.get())
+        self._record_slow(route, statement, parameters, executemany, duration_ms)
+        if random.random() < self.explain_sample_rate:
+            self._schedule_explain(conn.engine, (route, statement), statement, parameters, executemany)
+
+    def _schedule_explain(self, engine: Engine, key: tuple, statement, parameters, executemany):
+        # ANALYZE runs the statement again, so only ever explain reads
+        if executemany or engine.dialect.name != "postgresql" or not statement.lstrip().upper().startswith("SELECT"):
+            return
+        with self._lock:
+            if self._pending_explains >= self.max_pending_explains:
+                return
+            self._pending_explains += 1
+        self._explain_executor.submit(self._explain, engine, key, statement, parameters)
+
+    def _explain(self, engine: Engine, key: tuple, statement, parameters):
+        # Runs on its own connection and transaction, off the request path: a failed or
+        # timed-out EXPLAIN can never abort the transaction of the request that triggered it
+        token = _explaining.set(True)
+        plan = None
+        try:
+            with engine.connect() as conn, conn.begin() as transaction:
+                conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(self.explain_timeout_ms)}")
+                rows = conn.exec_driver_sql("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters).fetchall()
+                transaction.rollback()
+            plan = [row[0] for row in rows]
+        except Exception as e:
+            logger.warning("EXPLAIN capture failed: %s", e)
+        finally:
+            _explaining.reset(token)
+            with self._lock:
+                self._pending_explains -= 1
+                entry = self.slow_queries.get(key)
+                if plan is not None and entry is not None:
+                    entry["explain"] = plan
+
+    def _record_slow(self, route, statement, parameters, executemany, duration_ms):
+        key = (route, statement)
+        with self._lock:
+            entry = self.slow_queries.get(key)
+            if entry is None:
+                if len(self.slow_queries) >= self.max_entries:
+                    return
+                entry = self.slow_queries[key] = {
+                    "route": route,
+                    "statement": statement,
+                    "parameters": parameter_shape(parameters, executemany),
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "explain": None,
+                }
+            entry["count"] += 1
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+
+    def finish_request(self, scope: dict, statements: Counter):
+        route = route_name(scope)
+        with self._lock:
+            for statement, count in statements.items():
+                if count < self.n_plus_one_threshold:
+                    continue
+                key = (route, statement)
+                entry = self.n_plus_one.get(key)
+                if entry is None:
+                    if len(self.n_plus_one) >= self.max_entries:
+                        continue
+                    entry = self.n_plus_one[key] = {
+                        "route": route,
+                        "statement": statement,
+                        "requests": 0,
+                        "max_executions": 0,
+                    }
+                entry["requests"] += 1
+                entry["max_executions"] = max(entry["max_executions"], count)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            slow = sorted(self.slow_queries.values(), key=lambda e: e["total_ms"], reverse=True)
+            return {
+                "threshold_ms": self.threshold_ms,
+                "slow_queries": [
+                    {**entry, "avg_ms": entry["total_ms"] / entry["count"]} for entry in slow
+                ],
+                "n_plus_one": sorted(self.n_plus_one.values(), key=lambda e: e["requests"], reverse=True),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.slow_queries.clear()
+            self.n_plus_one.clear()
+
+
+query_profiler = QueryProfiler()